@@ -1,15 +1,100 @@
+import atexit
 import json
+import logging
 import os
+import re
 from datetime import datetime, timedelta
-from functools import reduce
+from functools import lru_cache
+from array import array
+from bisect import bisect_right, insort
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the json module
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # optional, falls back to json.load
+    ijson = None
+
+try:
+    import numpy as np
+except ImportError:  # optional, only used for bulk parsing and batch streaks
+    np = None
+
+# Below this many completions per-item fromisoformat is cheaper than numpy
+BULK_PARSE_MIN = 64
+# ISO-8601 date/time without a UTC offset
+_NAIVE_ISO = re.compile(r"\d{4}-\d{2}-\d{2}([T ][\d:.]*)?")
+# Below this many habits per-habit streak() calls are cheaper than numpy
+BATCH_STREAK_MIN = 256
 
 DATA_FILE = "habits.json"
 
+logger = logging.getLogger(__name__)
+
+
+# Days back to Monday, indexed by ordinal % 7 (ordinal 1, 0001-01-01,
+# is a Monday)
+_MON_OFFSET = (6, 0, 1, 2, 3, 4, 5)
+
+
+# A daily period is the day itself
+def _day_ordinal(ordinal):
+    return ordinal
+
+
+# Ordinal of the Monday starting the week of `ordinal`
+def _monday_ordinal(ordinal):
+    return ordinal - _MON_OFFSET[ordinal % 7]
+
+
+@lru_cache(maxsize=4096)
+def _period_start(periodicity, ordinal):
+    if periodicity == "weekly":
+        ordinal = _monday_ordinal(ordinal)
+    return datetime.fromordinal(ordinal)
+
+
+# Length of the run of consecutive ordinals ending at `current`
+def _run_ending_at(ordinals, current):
+    i = bisect_right(ordinals, current) - 1
+    if i < 0 or ordinals[i] != current:
+        return 0
+
+    # Within a run, ordinals[k] - k is constant, and it only grows across
+    # gaps, so the start of the run can be binary-searched too
+    lo, hi = 0, i
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ordinals[mid] - mid < current - i:
+            lo = mid + 1
+        else:
+            hi = mid
+    return i - lo + 1
+
 
 # =========================
 # Habit Model
 # =========================
 class Habit:
+    __slots__ = (
+        "name",
+        "periodicity",
+        "created_at",
+        "completions",
+        "_completed_days",
+        "_completed_weeks",
+        "_ordinals",
+        "_week_ordinals",
+        "_streak_cache",
+        "_streak_ref_day",
+        "_dirty",
+        "_key_of",
+        "_store",
+    )
+
     def __init__(self, name, periodicity, created_at=None, completions=None):
         if periodicity not in ("daily", "weekly"):
             raise ValueError("Periodicity must be 'daily' or 'weekly'")
@@ -19,86 +104,97 @@ class Habit:
         self.created_at = created_at or datetime.now()
         self.completions = completions or []
 
-    def complete(self, date=None):
-        date = date or datetime.now()
+        # Indexes of completed days / weeks (by their Monday's ordinal)
+        # for O(1) lookups
+        self._completed_days = {c.toordinal() for c in self.completions}
+        self._completed_weeks = {_monday_ordinal(d) for d in self._completed_days}
+        # Same days / weeks sorted, for binary-searched streaks
+        self._ordinals = array("i", sorted(self._completed_days))
+        self._week_ordinals = array(
+            "i", sorted(m // 7 for m in self._completed_weeks)
+        )
 
-        if self.periodicity == "daily":
-            already_completed = any(c.date() == date.date() for c in self.completions)
-        else:  # weekly
-            # Get the Monday of the week for the given date
-            week_start = (date - timedelta(days=date.weekday())).date()
-            # Check if any completion falls in the same week
-            already_completed = any(
-                (c - timedelta(days=c.weekday())).date() == week_start
-                for c in self.completions
-            )
+        # Periodicity never changes, so pick the duplicate check once:
+        # how a day maps to its period, and the index of completed periods
+        if periodicity == "daily":
+            self._key_of = _day_ordinal
+            self._store = self._completed_days
+        else:
+            self._key_of = _monday_ordinal
+            self._store = self._completed_weeks
+
+        # Last computed streak and the day it was computed for; only
+        # recomputed after a new completion or when the day changes
+        self._streak_cache = None
+        self._streak_ref_day = None
+        self._dirty = True
 
-        if not already_completed:
-            self.completions.append(date)
+    def complete(self, date=None):
+        date = date or datetime.now()
+        day = date.toordinal()
+        if self._key_of(day) in self._store:
+            return False
+
+        self.completions.append(date)
+        monday = _monday_ordinal(day)
+        if day not in self._completed_days:
+            self._completed_days.add(day)
+            insort(self._ordinals, day)
+        if monday not in self._completed_weeks:
+            self._completed_weeks.add(monday)
+            insort(self._week_ordinals, monday // 7)
+        self._dirty = True
+        return True
 
     def completed_in_period(self, date):
-        start = self.period_start(date)
-        return any(c >= start for c in self.completions)
+        # Some completion falls on or after the period's first day
+        start = self.period_start(date).toordinal()
+        return bool(self._ordinals) and self._ordinals[-1] >= start
 
     def period_start(self, date):
-        if self.periodicity == "daily":
-            return datetime(date.year, date.month, date.day)
-        start = date - timedelta(days=date.weekday())
-        return datetime(start.year, start.month, start.day)
+        return _period_start(self.periodicity, date.toordinal())
 
     def streak(self, reference=None):
         reference = reference or datetime.now()
+        ref_day = reference.date()
 
-        if not self.completions:
-            return 0
+        if not self._dirty and ref_day == self._streak_ref_day:
+            return self._streak_cache
 
-        if self.periodicity == "daily":
-            # Get unique completion dates
-            completed_dates = {c.date() for c in self.completions}
+        self._streak_cache = self._compute_streak(ref_day)
+        self._streak_ref_day = ref_day
+        self._dirty = False
+        return self._streak_cache
 
-            # Start from today
-            current_date = reference.date()
-            streak = 0
+    # Sorted completed periods: day ordinals, or weeks numbered by their
+    # Monday's ordinal // 7
+    def period_ordinals(self):
+        if self.periodicity == "daily":
+            return self._ordinals
+        return self._week_ordinals
 
-            # Count backwards only if today is completed
-            if current_date not in completed_dates:
-                return 0
+    def _compute_streak(self, ref_day):
+        if not self.completions:
+            return 0
 
-            # Count consecutive days backwards
-            while current_date in completed_dates:
-                streak += 1
-                current_date -= timedelta(days=1)
+        today = ref_day.toordinal()
 
-            return streak
+        if self.periodicity == "daily":
+            # Start from today
+            return _run_ending_at(self._ordinals, today)
 
         # ---------- WEEKLY ----------
-        # Get all unique weeks (represented by their Monday)
-        completed_weeks = set()
-        for c in self.completions:
-            week_monday = c.date() - timedelta(days=c.date().weekday())
-            completed_weeks.add(week_monday)
-
-        # Get Monday of current week
-        current_week = reference.date() - timedelta(days=reference.date().weekday())
-
-        # Must complete current week to have a streak
-        if current_week not in completed_weeks:
-            return 0
-
-        streak = 0
-        # Count consecutive weeks backwards
-        while current_week in completed_weeks:
-            streak += 1
-            current_week -= timedelta(days=7)
-
-        return streak
+        # Mondays are 7 apart, so Monday ordinal // 7 numbers the weeks
+        # consecutively
+        return _run_ending_at(self._week_ordinals, _monday_ordinal(today) // 7)
 
     def to_dict(self):
         return {
             "name": self.name,
             "periodicity": self.periodicity,
             "created_at": self.created_at.isoformat(),
-            "completions": [c.isoformat() for c in self.completions],
+            # Only the day of a completion is ever used, so store its ordinal
+            "completions": [c.toordinal() for c in self.completions],
         }
 
     @staticmethod
@@ -107,59 +203,353 @@ class Habit:
             data["name"],
             data["periodicity"],
             datetime.fromisoformat(data["created_at"]),
-            [datetime.fromisoformat(c) for c in data["completions"]],
+            _parse_completions(data["completions"]),
         )
 
 
+def _parse_completions(values):
+    if values and isinstance(values[0], str):
+        return _parse_iso_completions(values)
+    return [_parse_completion(c) for c in values]
+
+
+# Older files store completions as ISO-8601 strings
+def _parse_iso_completions(values):
+    # numpy converts UTC offsets away, so only naive values take that path
+    if (
+        np is not None
+        and len(values) > BULK_PARSE_MIN
+        and all(_NAIVE_ISO.fullmatch(c) for c in values)
+    ):
+        # One C-level parse for the whole list; microsecond precision is
+        # the finest unit that still converts back to datetime objects
+        return np.array(values, dtype="datetime64[us]").tolist()
+    return [datetime.fromisoformat(c) for c in values]
+
+
+def _parse_completion(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return datetime.fromordinal(value)
+
+
+# Current streak of every habit in one vectorised pass
+def _batch_streaks(habits, ref_day):
+    today = ref_day.toordinal()
+    this_week = _monday_ordinal(today) // 7
+    daily = [h.periodicity == "daily" for h in habits]
+
+    keys = [h.period_ordinals() for h in habits]
+    currents = np.array([today if d else this_week for d in daily], dtype=np.int64)
+    vals = np.concatenate([np.asarray(k, dtype=np.int64) for k in keys])
+    ids = np.repeat(np.arange(len(habits)), [len(k) for k in keys])
+
+    # Each habit's block is already sorted; drop periods after the current one
+    keep = vals <= currents[ids]
+    vals, ids = vals[keep], ids[keep]
+    streaks = np.zeros(len(habits), dtype=np.int64)
+    if not len(vals):
+        return streaks
+
+    # A run starts wherever the habit changes or consecutive periods have a gap
+    idx = np.arange(len(vals))
+    starts = np.ones(len(vals), dtype=bool)
+    starts[1:] = (np.diff(vals) != 1) | (np.diff(ids) != 0)
+    run_start = np.maximum.accumulate(np.where(starts, idx, 0))
+
+    # Only a run whose last period is the current one counts as a streak
+    last = np.flatnonzero(np.append(ids[1:] != ids[:-1], True))
+    last = last[vals[last] == currents[ids[last]]]
+    streaks[ids[last]] = last - run_start[last] + 1
+    return streaks
+
+
+# Make sure the contents are on disk before the file is renamed into place
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _is_complete_event(line):
+    if not line.endswith(b"\n"):
+        return False
+    try:
+        json.loads(line)
+    except ValueError:
+        return False
+    return True
+
+
 # =========================
 # Habit Tracker
 # =========================
 class HabitTracker:
     def __init__(self, filename=DATA_FILE):
         self.filename = filename
-        self.habits = self.load()
+        # Append-only event log replayed on top of the snapshot in `filename`
+        self.log_filename = os.path.splitext(filename)[0] + ".log"
+        # Loaded from disk on first access, see `habits`
+        self._habits = None
+        # Read-only copy of `_habits` handed out by `habits`
+        self._view = None
+        # Same habits grouped by periodicity, kept in step with `habits`
+        self._by_period = None
+        # Whether the event log holds changes not yet in the snapshot
+        self._dirty = False
+        # Bumped by every snapshot; log events are tagged with the
+        # generation they apply on top of. None until read from disk
+        self._generation = None
+        # Set when the habits were replaced wholesale, so the next change is
+        # written as a full snapshot rather than logged against the old one
+        self._needs_snapshot = False
+        # Completions the snapshot and log account for; any others were
+        # added outside the tracker
+        self._completion_count = 0
+
+    @property
+    def habits(self):
+        habits = self._ensure_loaded()
+        if self._view is None:
+            self._view = tuple(habits)
+        return self._view
+
+    # Use add_habit / delete_habit to change the habits one at a time
+    @habits.setter
+    def habits(self, habits):
+        self._set_habits(habits)
+        self._needs_snapshot = True
+
+    def _ensure_loaded(self):
+        if self._habits is None:
+            self._set_habits(self.load())
+        return self._habits
+
+    def _set_habits(self, habits):
+        self._habits = list(habits)
+        self._view = None
+        self._by_period = {"daily": [], "weekly": []}
+        for h in self._habits:
+            self._by_period[h.periodicity].append(h)
+        self._completion_count = sum(len(h.completions) for h in self._habits)
 
     def add_habit(self, name, periodicity):
-        self.habits.append(Habit(name, periodicity))
-        self.save()
+        habit = Habit(name, periodicity)
+        self._ensure_loaded().append(habit)
+        self._view = None
+        self._by_period[periodicity].append(habit)
+        self._append_event({"op": "add", "habit": habit.to_dict()})
 
     def complete_habit(self, index, date=None):
-        self.habits[index].complete(date)
-        self.save()
+        date = date or datetime.now()
+        # Re-completing within the same period changes nothing to persist
+        if self._ensure_loaded()[index].complete(date):
+            self._completion_count += 1
+            self._append_event(
+                {"op": "complete", "idx": index, "date": date.toordinal()}
+            )
 
     def delete_habit(self, index):
-        del self.habits[index]
-        self.save()
+        habit = self._ensure_loaded().pop(index)
+        self._view = None
+        self._by_period[habit.periodicity].remove(habit)
+        self._completion_count -= len(habit.completions)
+        self._append_event({"op": "delete", "idx": index})
 
     # -------- Analytics (Functional Programming) --------
     def all_habits(self):
         return self.habits
 
     def habits_by_periodicity(self, period):
-        return list(filter(lambda h: h.periodicity == period, self.habits))
+        self._ensure_loaded()
+        return list(self._by_period.get(period, []))
 
     def longest_streak_all(self):
         if not self.habits:
             return None
-        return reduce(
-            lambda a, b: a if a.streak() >= b.streak() else b,
-            self.habits,
-        )
+        if np is not None and len(self.habits) >= BATCH_STREAK_MIN:
+            # argmax returns the first maximum, so ties still go to the
+            # first habit
+            streaks = _batch_streaks(self.habits, datetime.now().date())
+            return self.habits[int(np.argmax(streaks))]
+
+        # Check habits most likely to win first and stop once no remaining
+        # habit has enough completed periods to beat the best streak so far
+        # A streak can never be longer than the number of completed periods
+        bounds = [(len(h.period_ordinals()), i) for i, h in enumerate(self.habits)]
+        bounds.sort(key=lambda t: t[0], reverse=True)
+
+        best_index, best_streak = None, -1
+        for bound, i in bounds:
+            if bound < best_streak:
+                break
+            s = self.habits[i].streak()
+            # Ties go to the first habit, as before
+            if s > best_streak or (s == best_streak and i < best_index):
+                best_index, best_streak = i, s
+        return self.habits[best_index]
 
     def longest_streak_for(self, index):
         return self.habits[index].streak()
 
     # -------- Persistence --------
+    # Writes a full snapshot, which makes the event log redundant
     def save(self):
-        with open(self.filename, "w") as f:
-            json.dump([h.to_dict() for h in self.habits], f, indent=4)
+        # Nothing loaded means nothing changed
+        if self._habits is None:
+            return
+
+        # Write next to the data file and swap it in, so a crash mid-write
+        # never leaves a truncated snapshot behind
+        tmp = self.filename + ".tmp"
+        if self._generation is None:
+            self._generation = self._disk_generation()
+        generation = self._generation + 1
+        snapshot = {
+            "generation": generation,
+            "habits": [h.to_dict() for h in self._habits],
+        }
+        # Both encoders produce the same layout
+        if orjson is not None:
+            data = orjson.dumps(snapshot, option=orjson.OPT_INDENT_2)
+        else:
+            data = json.dumps(snapshot, indent=2, ensure_ascii=False).encode()
+
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+                _sync(f)
+            # Once this snapshot is in place its generation retires the
+            # current log, so removing the log afterwards is only cleanup
+            os.replace(tmp, self.filename)
+            self._generation = generation
+            self._dirty = False
+            self._needs_snapshot = False
+            self._completion_count = sum(len(h.completions) for h in self._habits)
+        except OSError:
+            logger.exception("Could not save habits to %s", self.filename)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        # Events left over if we stop before this point are tagged with an
+        # older generation and skipped on replay
+        if os.path.exists(self.log_filename):
+            os.remove(self.log_filename)
+
+    def compact(self):
+        self.save()
+
+    # Folds pending changes into the snapshot; a no-op when nothing changed
+    def flush(self):
+        if self._dirty:
+            self.save()
 
     def load(self):
         if not os.path.exists(self.filename):
+            # Log events only make sense on top of their snapshot
+            if os.path.exists(self.log_filename):
+                os.remove(self.log_filename)
+            self._generation = 0
             return self.seed_data()
 
-        with open(self.filename, "r") as f:
-            return [Habit.from_dict(d) for d in json.load(f)]
+        habits, legacy = self._load_snapshot()
+        self._replay_log(habits)
+        # Rewrite ISO-string completions as ordinals once
+        if legacy:
+            self._set_habits(habits)
+            self.save()
+        return habits
+
+    def _load_snapshot(self):
+        habits = []
+        legacy = False
+        with open(self.filename, "rb") as f:
+            self._generation, dicts = self._read_snapshot(f)
+            for d in dicts:
+                legacy = legacy or any(isinstance(c, str) for c in d["completions"])
+                habits.append(Habit.from_dict(d))
+        return habits, legacy
+
+    def _disk_generation(self):
+        if not os.path.exists(self.filename):
+            return 0
+        with open(self.filename, "rb") as f:
+            return self._read_snapshot(f)[0]
+
+    # Returns (generation, habit dicts); older files are a bare list of
+    # habits and count as generation 0. orjson parses the whole file faster
+    # than ijson streams it, so ijson is only used when orjson is missing
+    def _read_snapshot(self, f):
+        if orjson is not None or ijson is None:
+            data = orjson.loads(f.read()) if orjson is not None else json.load(f)
+            if isinstance(data, list):
+                return 0, data
+            return data["generation"], data["habits"]
+
+        # Build each habit as soon as it is parsed instead of
+        # materialising the whole document first
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == b"[":
+            return 0, ijson.items(f, "item")
+        generation = next(ijson.items(f, "generation"))
+        f.seek(0)
+        return generation, ijson.items(f, "habits.item")
+
+    def _append_event(self, event):
+        # The log can't describe habits replaced wholesale or completed
+        # outside the tracker, so write everything out instead
+        if self._needs_snapshot or self._completion_count != sum(
+            len(h.completions) for h in self._habits
+        ):
+            self.save()
+            return
+
+        event["gen"] = self._generation
+        with open(self.log_filename, "ab") as f:
+            f.write(json.dumps(event).encode() + b"\n")
+        self._dirty = True
+
+        # Once replaying the log costs more than reading a snapshot,
+        # fold it back into one
+        snapshot_size = (
+            os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+        )
+        if os.path.getsize(self.log_filename) > snapshot_size:
+            self.compact()
+
+    def _replay_log(self, habits):
+        if not os.path.exists(self.log_filename):
+            return
+
+        with open(self.log_filename, "rb") as f:
+            lines = f.readlines()
+
+        offset = 0
+        for n, line in enumerate(lines):
+            # A crash mid-append leaves a partial last line; drop it so the
+            # next event starts on a line of its own
+            if n == len(lines) - 1 and not _is_complete_event(line):
+                with open(self.log_filename, "r+b") as f:
+                    f.truncate(offset)
+                break
+            offset += len(line)
+
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            # Skip events written against any other snapshot, e.g. ones
+            # it already includes
+            if event.get("gen", 0) != self._generation:
+                continue
+            if event["op"] == "add":
+                habits.append(Habit.from_dict(event["habit"]))
+            elif event["op"] == "complete":
+                habits[event["idx"]].complete(_parse_completion(event["date"]))
+            elif event["op"] == "delete":
+                del habits[event["idx"]]
 
     # -------- Seed Data (5 habits, 4 weeks) --------
     def seed_data(self):
@@ -189,6 +579,7 @@ class HabitTracker:
 # =========================
 def main():
     tracker = HabitTracker()
+    atexit.register(tracker.flush)
 
     while True:
         print("\n1 Add | 2 Complete | 3 Delete | 4 View | 5 Analytics | 6 Exit")
@@ -1,6 +1,9 @@
 import unittest
 from datetime import datetime, timedelta
 import os
+import json
+from unittest import mock
+import habit_tracker
 from habit_tracker import Habit, HabitTracker
 
 
@@ -39,8 +42,8 @@ class TestHabit(unittest.TestCase):
     def test_daily_habit_complete_twice_same_day(self):
         """Test that completing a daily habit twice on the same day only counts once."""
         habit = Habit("Exercise", "daily")
-        habit.complete(self.today)
-        habit.complete(self.today)
+        self.assertTrue(habit.complete(self.today))
+        self.assertFalse(habit.complete(self.today))
         self.assertEqual(len(habit.completions), 1)
 
     def test_weekly_habit_complete_once(self):
@@ -69,6 +72,22 @@ class TestHabit(unittest.TestCase):
         habit.complete(week2)
         self.assertEqual(len(habit.completions), 2)
 
+    def test_completed_in_period(self):
+        """Test period checks for daily and weekly habits."""
+        daily = Habit("Exercise", "daily")
+        weekly = Habit("Call Family", "weekly")
+        daily.complete(self.today)
+        weekly.complete(self.today + timedelta(days=2))  # Wednesday
+
+        self.assertTrue(daily.completed_in_period(self.today))
+        self.assertFalse(daily.completed_in_period(self.today + timedelta(days=1)))
+        self.assertTrue(weekly.completed_in_period(self.today + timedelta(days=6)))
+        self.assertFalse(weekly.completed_in_period(self.today + timedelta(days=7)))
+        self.assertEqual(
+            weekly.period_start(self.today + timedelta(days=6)),
+            datetime(2024, 1, 15),
+        )
+
     def test_daily_streak_zero_no_completions(self):
         """Test that streak is 0 when there are no completions."""
         habit = Habit("Exercise", "daily")
@@ -100,6 +119,26 @@ class TestHabit(unittest.TestCase):
 
         self.assertEqual(habit.streak(self.today), 2)  # Only today and yesterday count
 
+    def test_daily_streak_long_history_with_gap(self):
+        """Test daily streak over a long history only counts the latest run."""
+        habit = Habit("Exercise", "daily")
+        for i in range(400):
+            if i != 150:
+                habit.complete(self.today - timedelta(days=i))
+
+        self.assertEqual(habit.streak(self.today), 150)
+        self.assertEqual(habit.streak(self.today - timedelta(days=151)), 249)
+
+    def test_streak_updates_after_new_completion(self):
+        """Test that a cached streak is refreshed when the habit is completed."""
+        habit = Habit("Exercise", "daily")
+        habit.complete(self.today - timedelta(days=1))
+        self.assertEqual(habit.streak(self.today), 0)
+
+        habit.complete(self.today)
+        self.assertEqual(habit.streak(self.today), 2)
+        self.assertEqual(habit.streak(self.today - timedelta(days=1)), 1)
+
     def test_daily_streak_zero_if_today_not_completed(self):
         """Test that daily streak is 0 if today is not completed."""
         habit = Habit("Exercise", "daily")
@@ -162,15 +201,26 @@ class TestHabit(unittest.TestCase):
         self.assertEqual(restored_habit.periodicity, habit.periodicity)
         self.assertEqual(len(restored_habit.completions), 1)
 
+    def test_restored_habit_rejects_duplicate_completion(self):
+        """Test that a loaded habit still prevents duplicate completions."""
+        habit = Habit("Call Family", "weekly", self.today, [self.today])
+        restored_habit = Habit.from_dict(habit.to_dict())
+
+        restored_habit.complete(self.today + timedelta(days=2))
+        self.assertEqual(len(restored_habit.completions), 1)
+        self.assertEqual(restored_habit.streak(self.today), 1)
+
 
 class TestHabitTracker(unittest.TestCase):
 
     def setUp(self):
         """Set up test fixtures before each test method."""
         self.test_file = "test_habits.json"
-        # Remove test file if it exists to ensure clean state
-        if os.path.exists(self.test_file):
-            os.remove(self.test_file)
+        self.test_log = "test_habits.log"
+        # Remove test files if they exist to ensure clean state
+        for path in (self.test_file, self.test_log):
+            if os.path.exists(path):
+                os.remove(path)
         self.tracker = HabitTracker(self.test_file)
         # Clear seed data to start with empty tracker for most tests
         self.tracker.habits = []
@@ -178,8 +228,9 @@ class TestHabitTracker(unittest.TestCase):
 
     def tearDown(self):
         """Clean up after each test method."""
-        if os.path.exists(self.test_file):
-            os.remove(self.test_file)
+        for path in (self.test_file, self.test_log):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_add_habit(self):
         """Test adding a habit."""
@@ -207,6 +258,18 @@ class TestHabitTracker(unittest.TestCase):
             initial_completions + 1
         )
 
+    def test_complete_habit_twice_skips_save(self):
+        """Test that a duplicate completion does not rewrite the data file."""
+        self.tracker.add_habit("Exercise", "daily")
+        self.tracker.complete_habit(0)
+        for path in (self.test_file, self.test_log):
+            if os.path.exists(path):
+                os.remove(path)
+
+        self.tracker.complete_habit(0)
+        self.assertFalse(os.path.exists(self.test_file))
+        self.assertFalse(os.path.exists(self.test_log))
+
     def test_habits_by_periodicity(self):
         """Test filtering habits by periodicity."""
         # Start fresh
@@ -222,6 +285,17 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(len(daily_habits), 2)
         self.assertEqual(len(weekly_habits), 1)
 
+        self.tracker.delete_habit(0)
+        daily_names = [h.name for h in self.tracker.habits_by_periodicity("daily")]
+        self.assertEqual(daily_names, ["Daily 2"])
+
+        # The habit list itself can't be changed around the index
+        with self.assertRaises(AttributeError):
+            self.tracker.habits.append(Habit("Daily 3", "daily"))
+
+        self.tracker.habits = (Habit(n, "weekly") for n in ("Weekly 2", "Weekly 3"))
+        self.assertEqual(len(self.tracker.habits_by_periodicity("weekly")), 2)
+
     def test_longest_streak_all(self):
         """Test finding habit with longest streak."""
         # Start fresh
@@ -243,6 +317,41 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(longest.name, "Long Streak")
         self.assertEqual(longest.streak(), 5)
 
+    @unittest.skipIf(habit_tracker.np is None, "numpy not installed")
+    def test_batch_streaks_match_streak(self):
+        """Test that vectorised streaks agree with Habit.streak."""
+        today = datetime.now()
+        habits = [Habit("Daily", "daily"), Habit("Weekly", "weekly"), Habit("None", "daily")]
+        for i in (0, 1, 2, 4):
+            habits[0].complete(today - timedelta(days=i))
+        for i in (0, 1, 3):
+            habits[1].complete(today - timedelta(days=i * 7))
+
+        streaks = habit_tracker._batch_streaks(habits, today.date())
+        self.assertEqual(list(streaks), [h.streak(today) for h in habits])
+
+    @unittest.skipIf(habit_tracker.np is None, "numpy not installed")
+    def test_longest_streak_all_batch_matches_per_habit(self):
+        """Test that the batch path picks the same habit, ties included."""
+        today = datetime.now()
+        habits = [Habit("Short", "daily"), Habit("Tie 1", "daily"),
+                  Habit("Weekly", "weekly"), Habit("Tie 2", "daily")]
+        for i in range(2):
+            habits[0].complete(today - timedelta(days=i))
+        for i in range(3):
+            habits[1].complete(today - timedelta(days=i))
+        for i in range(3):
+            habits[2].complete(today - timedelta(days=i * 7))
+        # Same streak as "Tie 1" but more completed days overall
+        for i in (0, 1, 2, 4, 5, 6):
+            habits[3].complete(today - timedelta(days=i))
+        self.tracker.habits = habits
+
+        expected = self.tracker.longest_streak_all()
+        self.assertEqual(expected.name, "Tie 1")
+        with mock.patch.object(habit_tracker, "BATCH_STREAK_MIN", 1):
+            self.assertIs(self.tracker.longest_streak_all(), expected)
+
     def test_longest_streak_for(self):
         """Test getting streak for specific habit."""
         # Start fresh
@@ -272,6 +381,143 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(len(new_tracker.habits), 1)
         self.assertEqual(new_tracker.habits[0].name, "Persistent")
 
+    def test_habits_loaded_lazily(self):
+        """Test that the data file is not read until habits are accessed."""
+        lazy_file = "test_lazy_habits.json"
+        if os.path.exists(lazy_file):
+            os.remove(lazy_file)
+
+        HabitTracker(lazy_file)
+        self.assertFalse(os.path.exists(lazy_file))
+
+        # Clean up
+        if os.path.exists(lazy_file):
+            os.remove(lazy_file)
+
+    def test_save_leaves_no_temp_file(self):
+        """Test that saving replaces the data file without leaving a temp file."""
+        self.tracker.add_habit("Saved", "daily")
+        self.tracker.save()
+
+        self.assertTrue(os.path.exists(self.test_file))
+        self.assertFalse(os.path.exists(self.test_file + ".tmp"))
+
+    def test_flush_only_saves_pending_changes(self):
+        """Test that flush writes a snapshot only after something changed."""
+        self.tracker.flush()
+        os.remove(self.test_file)
+        self.tracker.flush()
+        self.assertFalse(os.path.exists(self.test_file))
+
+        self.tracker.add_habit("Pending", "daily")
+        self.tracker.save()
+        self.tracker.complete_habit(0)
+        self.assertTrue(os.path.exists(self.test_log))
+
+        self.tracker.flush()
+        self.assertFalse(os.path.exists(self.test_log))
+        new_tracker = HabitTracker(self.test_file)
+        self.assertEqual(len(new_tracker.habits[0].completions), 1)
+
+    def test_persistence_replays_event_log(self):
+        """Test that completions and deletions are restored from the event log."""
+        self.tracker.add_habit("Keep", "daily")
+        self.tracker.add_habit("Drop", "weekly")
+        self.tracker.save()
+
+        today = datetime.now()
+        self.tracker.complete_habit(0, today)
+        self.tracker.delete_habit(1)
+        self.assertTrue(os.path.exists(self.test_log))
+
+        new_tracker = HabitTracker(self.test_file)
+        self.assertEqual([h.name for h in new_tracker.habits], ["Keep"])
+        self.assertEqual(new_tracker.habits[0].streak(today), 1)
+
+    def test_load_migrates_iso_completions(self):
+        """Test that completions stored as ISO strings are rewritten as ordinals."""
+        today = datetime.now()
+        with open(self.test_file, "w") as f:
+            json.dump([{
+                "name": "Legacy",
+                "periodicity": "daily",
+                "created_at": today.isoformat(),
+                "completions": [today.isoformat()],
+            }], f)
+
+        tracker = HabitTracker(self.test_file)
+        self.assertEqual(tracker.habits[0].streak(today), 1)
+
+        with open(self.test_file) as f:
+            saved = json.load(f)["habits"]
+        self.assertEqual(saved[0]["completions"], [today.toordinal()])
+
+    def test_replay_skips_events_already_in_snapshot(self):
+        """Test that a log left behind by an interrupted save is not replayed."""
+        for name in ("A", "B", "C"):
+            self.tracker.add_habit(name, "daily")
+        self.tracker.save()
+        self.tracker.delete_habit(0)
+
+        # Crash after the new snapshot is in place but before the log is removed
+        with open(self.test_log, "rb") as f:
+            stale_log = f.read()
+        self.tracker.save()
+        with open(self.test_log, "wb") as f:
+            f.write(stale_log)
+
+        new_tracker = HabitTracker(self.test_file)
+        self.assertEqual([h.name for h in new_tracker.habits], ["B", "C"])
+
+    def test_replay_drops_partial_last_event(self):
+        """Test that a half-written last log line is ignored and truncated."""
+        self.tracker.add_habit("Exercise", "daily")
+        self.tracker.save()
+        self.tracker.complete_habit(0)
+        with open(self.test_log, "ab") as f:
+            f.write(b'{"op": "delete", "id')
+
+        new_tracker = HabitTracker(self.test_file)
+        self.assertEqual(len(new_tracker.habits), 1)
+        self.assertEqual(len(new_tracker.habits[0].completions), 1)
+
+        new_tracker.complete_habit(0, datetime.now() + timedelta(days=1))
+        self.assertEqual(len(HabitTracker(self.test_file).habits[0].completions), 2)
+
+    def test_replaced_habits_are_persisted(self):
+        """Test that changes after assigning habits are saved in full."""
+        self.tracker.add_habit("Old", "daily")
+        self.tracker.save()
+
+        new_tracker = HabitTracker(self.test_file)
+        new_tracker.habits = []
+        new_tracker.add_habit("Only", "daily")
+
+        reloaded = HabitTracker(self.test_file)
+        self.assertEqual([h.name for h in reloaded.habits], ["Only"])
+
+    def test_direct_completion_persisted_by_next_change(self):
+        """Test that completions made on a habit directly are not lost."""
+        self.tracker.add_habit("Exercise", "daily")
+        self.tracker.save()
+
+        self.tracker.habits[0].complete(datetime.now())
+        self.tracker.add_habit("Read", "daily")
+
+        reloaded = HabitTracker(self.test_file)
+        self.assertEqual(len(reloaded.habits[0].completions), 1)
+
+    def test_log_without_snapshot_is_discarded(self):
+        """Test that a log whose snapshot is gone is dropped and data reseeded."""
+        self.tracker.add_habit("Exercise", "daily")
+        self.tracker.save()
+        self.tracker.complete_habit(0)
+        os.remove(self.test_file)
+
+        new_tracker = HabitTracker(self.test_file)
+        self.assertEqual(len(new_tracker.habits), 5)
+        self.assertFalse(os.path.exists(self.test_log))
+
     def test_all_habits(self):
         """Test getting all habits."""
         # Start fresh
@@ -306,6 +552,80 @@ class TestHabitTracker(unittest.TestCase):
             os.remove(seed_file)
 
 
+
+class TestOptionalBackends(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a tracker with a couple of habits."""
+        self.test_file = "test_backend_habits.json"
+        self.test_log = "test_backend_habits.log"
+        self.today = datetime.now()
+        self.tracker = HabitTracker(self.test_file)
+        self.tracker.habits = [
+            Habit("Exercise", "daily", self.today, [self.today]),
+            Habit("Call Family", "weekly", self.today, [self.today]),
+        ]
+
+    def tearDown(self):
+        """Clean up after each test method."""
+        for path in (self.test_file, self.test_log):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def assert_reloads(self):
+        new_tracker = HabitTracker(self.test_file)
+        self.assertEqual(
+            [h.name for h in new_tracker.habits], ["Exercise", "Call Family"]
+        )
+        self.assertEqual([h.streak(self.today) for h in new_tracker.habits], [1, 1])
+
+    def test_json_fallback(self):
+        """Test saving and loading with neither orjson nor ijson."""
+        with mock.patch.object(habit_tracker, "orjson", None), \
+                mock.patch.object(habit_tracker, "ijson", None):
+            self.tracker.save()
+            with open(self.test_file) as f:
+                self.assertEqual(json.load(f)["generation"], 1)
+            self.assert_reloads()
+
+    @unittest.skipIf(habit_tracker.ijson is None, "ijson not installed")
+    def test_ijson_load(self):
+        """Test streaming the snapshot with ijson when orjson is missing."""
+        self.tracker.save()
+        with mock.patch.object(habit_tracker, "orjson", None):
+            self.assert_reloads()
+
+    @unittest.skipIf(habit_tracker.ijson is None, "ijson not installed")
+    def test_ijson_load_bare_list_snapshot(self):
+        """Test streaming a snapshot in the older bare-list format."""
+        with open(self.test_file, "w") as f:
+            json.dump([h.to_dict() for h in self.tracker.habits], f)
+        with mock.patch.object(habit_tracker, "orjson", None):
+            self.assert_reloads()
+
+
+    @unittest.skipIf(habit_tracker.np is None, "numpy not installed")
+    def test_numpy_parses_long_iso_histories(self):
+        """Test bulk-parsing ISO completions longer than BULK_PARSE_MIN."""
+        values = [
+            (self.today - timedelta(days=i)).isoformat()
+            for i in range(habit_tracker.BULK_PARSE_MIN + 1)
+        ]
+        parsed = habit_tracker._parse_completions(values)
+        self.assertEqual(parsed, [datetime.fromisoformat(v) for v in values])
+
+        habit = Habit("Exercise", "daily", self.today, parsed)
+        self.assertEqual(habit.streak(self.today), len(values))
+
+    def test_long_iso_histories_keep_utc_offsets(self):
+        """Test that offset-aware ISO completions parse the same at any length."""
+        values = [
+            datetime(2024, 1, 15, 23, 30, 0).isoformat() + "-05:00"
+        ] * (habit_tracker.BULK_PARSE_MIN + 1)
+        parsed = habit_tracker._parse_completions(values)
+        self.assertEqual(parsed, [datetime.fromisoformat(v) for v in values])
+
+
 if __name__ == "__main__":
     # Run all tests
     unittest.main(verbosity=2)
\ No newline at end of file